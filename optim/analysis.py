@@ -60,7 +60,7 @@ def chi2(obs, mod, err):
 @npsum
 def studentT(obs, mod, err):
     sigma = (obs - mod) / err
-    var = sum(sigma ** 2 / len(sigma))
+    var = np.sum(sigma ** 2) / len(sigma)
     nu = (2 * var) / (var - 1)
     x = (mod - obs) ** 2 / err
     t = (
@@ -22,6 +22,9 @@
 Constraints for optimizers to evaluate shark models against observations
 """
 
+import functools
+import math
+import multiprocessing.pool
 import os
 
 import common
@@ -52,57 +55,50 @@ dssfr = 0.2
 ssfrbins = np.arange(ssfrlow,ssfrupp,dssfr)
 
 
-# These are two easily create variables of these different shapes without
-# actually storing a reference ourselves; we don't need it
-zeros1 = lambda: np.zeros(shape=(1, 3, len(xmf)))
-zeros2 = lambda: np.zeros(shape=(1, 3, len(xmf2)))
+# Easily create histograms of this shape without actually storing a reference
+# ourselves; we don't need it
 zeros3 = lambda: np.zeros(shape=(1, len(mbins)))
-zeros4 = lambda: np.empty(shape=(1), dtype=np.bool_)
-zeros5 = lambda: np.zeros(shape=(1, len(ssfrbins)))
+
+def _read_model_data(modeldir, snapshot, subvols):
+    """Reads the model data needed by the constraints for the given snapshot"""
+
+    if  len(subvols) > 1:
+        subvols = ["multiple_batches"]
+    return common.read_data(modeldir, snapshot, smf.smf_HImf_fields, subvols)
 
 class Constraint(object):
     """Base classes for constraint objects"""
 
     def __init__(self):
         self.redshift_table = None
+        self._snapshots_table = None
+        self._snapshots_cache = None
 
-    def _load_model_data(self, modeldir, subvols):
+    def _snapshots(self):
+        """Returns the snapshots corresponding to this constraint's redshifts,
+        which are looked up only once per redshift table"""
+        if self._snapshots_table is not self.redshift_table:
+            self._snapshots_cache = list(self.redshift_table[self.z])
+            self._snapshots_table = self.redshift_table
+        return self._snapshots_cache
 
-        if  len(subvols) > 1:
-            subvols = ["multiple_batches"]
+    def _load_model_data(self, modeldir, subvols, hdf5_cache=None):
 
         # Histograms we are interested in
         hist_smf = zeros3()
         hist_HImf = zeros3()
 
-        fields = {
-            'galaxies': (
-                'sfr_disk', 'sfr_burst', 'mstars_disk', 'mstars_bulge',
-                'rstar_disk', 'm_bh', 'matom_disk', 'mmol_disk', 'mgas_disk',
-                'matom_bulge', 'mmol_bulge', 'mgas_bulge',
-                'mgas_metals_disk', 'mgas_metals_bulge',
-                'mstars_metals_disk', 'mstars_metals_bulge', 'type',
-                'mvir_hosthalo', 'rstar_bulge')
-        }
-
-        for index, z in enumerate(self.z):
-            hdf5_data = common.read_data(modeldir, self.redshift_table[z], fields, subvols)
+        for index, snapshot in enumerate(self._snapshots()):
+            hdf5_data = hdf5_cache.get(snapshot) if hdf5_cache else None
+            if hdf5_data is None:
+                hdf5_data = _read_model_data(modeldir, snapshot, subvols)
             h0 = hdf5_data[0]
-            smf.prepare_data(hdf5_data, index, hist_smf, zeros3(), zeros3(),
-                             zeros3(), zeros3(), hist_HImf, zeros3(), zeros3(),
-                             zeros3(), zeros3(), zeros3(), zeros1(), zeros1(),
-                             zeros1(), zeros1(), zeros1(), zeros1(), zeros1(),
-                             zeros1(), zeros1(), zeros1(), zeros1(), zeros1(),
-                             zeros1(), zeros4(), zeros4(), zeros2(), zeros5(),
-                             zeros1(), zeros1(), zeros1(), zeros1(), zeros1(),
-                             zeros1())
+            smf.prepare_smf_HImf_data(hdf5_data, index, hist_smf, hist_HImf)
 
         #########################
         # take logs
-        ind = np.where(hist_smf > 0.)
-        hist_smf[ind] = np.log10(hist_smf[ind])
-        ind = np.where(hist_HImf > 0.)
-        hist_HImf[ind] = np.log10(hist_HImf[ind])
+        np.log10(hist_smf, out=hist_smf, where=hist_smf > 0.)
+        np.log10(hist_HImf, out=hist_HImf, where=hist_HImf > 0.)
 
         return h0, hist_smf, hist_HImf
 
@@ -110,27 +106,35 @@ class Constraint(object):
         obsdir = os.path.normpath(os.path.abspath(os.path.join(__file__, '..', '..', 'data')))
         return common.load_observation(obsdir, *args, **kwargs)
 
-    def _get_raw_data(self, modeldir, subvols):
+    def _get_raw_data(self, modeldir, subvols, hdf5_cache=None):
         """Gets the model and observational data for further analysis.
         The model data is interpolated to match the observation's X values."""
 
-        h0, hist_smf, hist_HImf = self._load_model_data(modeldir, subvols)
+        h0, hist_smf, hist_HImf = self._load_model_data(modeldir, subvols, hdf5_cache)
         x_obs, y_obs, y_dn, y_up = self.get_obs_x_y_err(h0)
         x_mod, y_mod = self.get_model_x_y(hist_smf, hist_HImf)
         return x_obs, y_obs, y_dn, y_up, x_mod, y_mod
 
-    def get_data(self, modeldir, subvols):
+    def get_data(self, modeldir, subvols, hdf5_cache=None):
+        """Returns the observed and model Y values within this constraint's
+        domain, plus their errors. `hdf5_cache` optionally maps snapshots to
+        model data that has already been read"""
 
-        x_obs, y_obs, y_dn, y_up, x_mod, y_mod = self._get_raw_data(modeldir, subvols)
+        x_obs, y_obs, y_dn, y_up, x_mod, y_mod = self._get_raw_data(modeldir, subvols, hdf5_cache)
 
-        # Linearly interpolate model Y values respect to the observations'
-        # X values, and only take those within the domain.
+        # Only take the observations within the domain, and linearly
+        # interpolate model Y values respect to their X values.
         # We also consider the biggest relative error as "the" error, in case
         # they are different
-        y_mod = np.interp(x_obs, x_mod, y_mod)
-        ind = np.where((x_obs >= self.domain[0]) & (x_obs <= self.domain[1]))
-        err = np.maximum(np.abs(y_dn[ind]), np.abs(y_up[ind]))
-        return y_obs[ind], y_mod[ind], err
+        ind = (x_obs >= self.domain[0]) & (x_obs <= self.domain[1])
+        y_mod = np.interp(x_obs[ind], x_mod, y_mod)
+        # y_dn[ind] and y_up[ind] are already copies, so work on them in place
+        err = y_dn[ind]
+        err_up = y_up[ind]
+        np.abs(err, out=err)
+        np.abs(err_up, out=err_up)
+        np.maximum(err, err_up, out=err)
+        return y_obs[ind], y_mod, err
 
 class HIMF(Constraint):
     """The HI Mass Function constraint"""
@@ -144,15 +148,15 @@ class HIMF(Constraint):
         dpdnHI = pHI - pdnHI
         dpupHI = pduHI - pHI
         hobs = 0.7
-        x_obs = lmHI + np.log10(pow(hobs, 2) / pow(h0, 2))
-        y_obs = pHI + np.log10(pow(h0, 3) / pow(hobs, 3))
+        x_obs = lmHI + 2 * math.log10(hobs / h0)
+        y_obs = pHI + 3 * math.log10(h0 / hobs)
         y_dn = dpdnHI
         y_up = dpupHI
         return x_obs, y_obs, y_dn, y_up
 
     def get_model_x_y(self, _, hist_HImf):
         y = hist_HImf[0]
-        ind = np.where(y < 0.)
+        ind = y < 0.
         return xmf[ind], y[ind]
 
 class SMF(Constraint):
@@ -162,7 +166,7 @@ class SMF(Constraint):
 
     def get_model_x_y(self, hist_smf, _):
         y = hist_smf[0,:]
-        ind = np.where(y < 0.)
+        ind = y < 0.
         return xmf[ind], y[ind]
 
 class SMF_z0(SMF):
@@ -173,18 +177,18 @@ class SMF_z0(SMF):
     def get_obs_x_y_err(self, _):
 
         lm, p, dpdn, dpup = self.load_observation('mf/SMF/GAMAII_BBD_GSMFs.dat', cols=[0,1,2,3])
-        indx = np.where(p > 0)
-        x_obs = lm[indx]
-        y_obs = np.log10(p[indx])
-        ytemp = p[indx] - dpdn[indx]
-        temp = np.less(ytemp, 0)
+        mask = p > 0
+        x_obs = lm[mask]
+        p = p[mask]
+        y_obs = np.log10(p)
+        ytemp = p - dpdn[mask]
 
         # fixing a problem where there were undefined values due to log of
         # negative values; negative values were given a minimum of 0.0001
-        fixed = 0.0001 * temp + ytemp * np.invert(temp)
+        fixed = np.where(ytemp < 0, 0.0001, ytemp)
 
         y_dn = y_obs - np.log10(fixed)
-        y_up = np.log10(p[indx]+dpup[indx]) - y_obs
+        y_up = np.log10(p + dpup[mask]) - y_obs
 
         return x_obs, y_obs, y_dn, y_up
 
@@ -200,7 +204,7 @@ class SMF_z1(SMF):
         hobs = 0.7
         pD17 = pD17 - 3.0 * np.log10(hobs)
         lmD17 = lmD17 - np.log10(hobs)
-        in_redshift = np.where(zD17 == 1)
+        in_redshift = zD17 == 1
         x_obs = lmD17[in_redshift]
         y_obs = pD17[in_redshift]
         y_dn = dp_dn_D17[in_redshift]
@@ -208,7 +212,7 @@ class SMF_z1(SMF):
 
         return x_obs, y_obs, y_dn, y_up
 
-_constraint_re = re.compile(r'([0-9_a-zA-Z]+)(?:\(([0-9\.]+)-([0-9\.]+)\))?')
+_constraint_re = re.compile(r'([0-9_a-zA-Z]+)(?:\(([0-9\.]+)-([0-9\.]+)\))?\Z')
 def parse(spec):
     """Parses a comma-separated string of constraint names into a list of
     Constraint objects. Specific domain values can be specified in `spec`"""
@@ -220,6 +224,14 @@ def parse(spec):
     }
 
     def _parse(s):
+        s = s.strip()
+
+        # Plain constraint names don't need the regex
+        if '(' not in s:
+            if s not in _constraints:
+                raise ValueError('Constraint does not specify a valid constraint: %s' % s)
+            return _constraints[s]()
+
         m = _constraint_re.match(s)
         if not m or m.group(1) not in _constraints:
             raise ValueError('Constraint does not specify a valid constraint: %s' % s)
@@ -233,4 +245,28 @@ def parse(spec):
             c.domain = (dn, up)
         return c
 
-    return [_parse(s) for s in spec.split(',')]
\ No newline at end of file
+    return [_parse(s) for s in spec.split(',')]
+
+def _evaluate(constraint, stat_test, modeldir, subvols, hdf5_cache):
+    y_obs, y_mod, err = constraint.get_data(modeldir, subvols, hdf5_cache)
+    return stat_test(y_obs, y_mod, err)
+
+def evaluate(constraints, stat_test, modeldir, subvols):
+    """Evaluates each of `constraints` against the model found in `modeldir`
+    using `stat_test`, and returns the list of values. The model data of each
+    snapshot is read only once, even if several constraints use it"""
+
+    snapshots = set(s for c in constraints for s in c._snapshots())
+    hdf5_cache = {s: _read_model_data(modeldir, s, subvols) for s in snapshots}
+
+    # Constraints are independent from each other, and numpy releases the GIL
+    # for most of the work. Threads (not processes) are used because we are
+    # usually already running inside one of the PSO worker processes
+    f = functools.partial(_evaluate, stat_test=stat_test, modeldir=modeldir,
+                          subvols=subvols, hdf5_cache=hdf5_cache)
+    pool = multiprocessing.pool.ThreadPool(max(len(constraints), 1))
+    try:
+        return pool.map(f, constraints)
+    finally:
+        pool.close()
+        pool.join()
@@ -41,7 +41,7 @@ import analysis
 try:
     import pandas
     import seaborn
-except:
+except ImportError:
     seaborn = pandas = None
 
 
@@ -138,9 +138,8 @@ def run_shark_hpc(particles, *args):
         _, simu, model, _ = common.read_configuration(opts.config)
         particle_outdir = os.path.join(shark_output_base, str(i))
         modeldir = common.get_shark_output_dir(particle_outdir, simu, model)
-        for j, constraint in enumerate(opts.constraints):
-            y_obs, y_mod, err = constraint.get_data(modeldir, subvols)
-            fx[i, j] = statTest(y_obs, y_mod, err)
+        for j, value in enumerate(constraints.evaluate(opts.constraints, statTest, modeldir, subvols)):
+            fx[i, j] = value
         if not opts.keep:
             shutil.rmtree(particle_outdir)
 
@@ -169,10 +168,7 @@ def run_shark(particle, *args):
         cmdline += ['-o', option]
     _exec_shark('Executing shark instance', cmdline)
 
-    total = 0
-    for constraint in opts.constraints:
-        y_obs, y_mod, err = constraint.get_data(modeldir, subvols)
-        total += statTest(y_obs, y_mod, err)
+    total = sum(constraints.evaluate(opts.constraints, statTest, modeldir, subvols))
 
     logger.info('Particle %r evaluated to %f', particle, total)
 
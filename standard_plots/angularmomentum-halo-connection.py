@@ -67,10 +67,10 @@ def prepare_data(hdf5_data, index, sam_vs_sam_halo_disk, sam_vs_sam_halo_gal,
      matom_bulge, mmol_bulge, mgas_bulge, sfr_disk, sfr_bulge, vvir, rgas_disk, rgas_bulge) = hdf5_data
 
     rvir  = G * mvir / pow(vvir,2.0) * MpcToKpc / h0
-    ind = np.where(rvir == max(rvir)) 
-    print 'maximum rvir', np.log10(max(rvir)), mvir[ind]
-    ind = np.where(mvir == max(mvir)) 
-    print 'maximum mvir', np.log10(rvir[ind]), max(mvir)
+    ind = np.where(rvir == rvir.max()) 
+    print 'maximum rvir', np.log10(rvir.max()), mvir[ind]
+    ind = np.where(mvir == mvir.max()) 
+    print 'maximum mvir', np.log10(rvir[ind]), mvir.max()
 
     rbar  = (rdisk * mdisk + rbulge * mbulge + rgas_disk * mgas_disk + rgas_bulge * mgas_bulge) / (mdisk + mbulge + mgas_disk + mgas_bulge) * MpcToKpc / h0
     rgal  = (rdisk * mdisk + rbulge * mbulge)/(mdisk + mbulge) * MpcToKpc / h0
@@ -236,6 +236,7 @@ def savefig(output_dir, fig, plotname):
 def read_data(model_dir, snapshot, fields, subvolumes, include_h0_volh=True):
     """Read the galaxies.hdf5 file for the given model/snapshot/subvolume"""
 
+    h0_volh = []
     data = collections.OrderedDict()
     for idx, subv in enumerate(subvolumes):
 
@@ -243,21 +244,18 @@ def read_data(model_dir, snapshot, fields, subvolumes, include_h0_volh=True):
         print('Reading galaxies data from %s' % fname)
         with h5py.File(fname, 'r') as f:
             if idx == 0 and include_h0_volh:
-                data['h0'] = f['cosmology/h'].value
-                data['vol'] = f['run_info/effective_volume'].value * len(subvolumes)
+                h0_volh.append(f['cosmology/h'].value)
+                h0_volh.append(f['run_info/effective_volume'].value * len(subvolumes))
 
             for gname, dsnames in fields.items():
                 group = f[gname]
                 for dsname in dsnames:
                     full_name = '%s/%s' % (gname, dsname)
-                    l = data.get(full_name, None)
-                    if l is None:
-                        l = group[dsname].value
-                    else:
-                        l = np.concatenate([l, group[dsname].value])
-                    data[full_name] = l
-
-    return list(data.values())
+                    data.setdefault(full_name, []).append(group[dsname].value)
+
+    # Concatenate the subvolumes only once at the end; growing each array one
+    # subvolume at a time copies the data over and over again
+    return h0_volh + [l[0] if len(l) == 1 else np.concatenate(l) for l in data.values()]
 
 def read_sfh(model_dir, snapshot, fields, subvolumes, include_h0_volh=True):
     """Read the galaxies.hdf5 file for the given model/snapshot/subvolume"""
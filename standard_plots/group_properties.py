@@ -17,8 +17,6 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
-import functools
-
 import numpy as np
 
 import common
@@ -51,8 +49,6 @@ def prepare_ax(ax, xmin, xmax, ymin, ymax, xtit, ytit):
 
 def prepare_data(hdf5_data):
 
-    bin_it = functools.partial(us.wmedians, xbins=xmf)
-
     # Unpack data
     (h0, _, typeg, mdisk, mbulge, _, _, mHI, mH2, mgas,
      mHI_bulge, mH2_bulge, mgas_bulge, mhalo, id_halo, 
@@ -89,11 +85,11 @@ def prepare_data(hdf5_data):
 	#select galaxies that belong to this halo
         ind = np.where(id_halo == unique_elements[i])
         if(len(mhalo[ind]) > 0):
-                total_bar_mass = sum(mdisk[ind]) + sum(mbulge[ind]) + sum(mgas[ind]) + sum(mgas_bulge[ind]) + sum(mhot[ind])
+                total_bar_mass = np.sum(mdisk[ind]) + np.sum(mbulge[ind]) + np.sum(mgas[ind]) + np.sum(mgas_bulge[ind]) + np.sum(mhot[ind])
                 mhalo_all      = mhalo[ind]
                 vvir_all       = vvir[ind]
 	        mmass_halo[i]  = mhalo_all[0] + total_bar_mass
-	        mHI_halo[i]    = (sum(mHI[ind]) * XH) #only HI
+	        mHI_halo[i]    = (np.sum(mHI[ind]) * XH) #only HI
                 vvir_halo[i]   = vvir[0]
                 rvir_halo[i]   = G * mmass_halo[i] / pow(vvir_halo[i], 2.0)
                 id_unique_halo[i] = unique_elements[i]
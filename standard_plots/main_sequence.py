@@ -241,7 +241,6 @@ def prepare_data(hdf5_data, index, redshift, mainseqsf, passive_fractions, hist_
      mgas_disk, mHI_bulge, mH2_bulge, mgas_bulge, mgas_metals_disk, mgas_metals_bulge, 
      mstars_metals_disk, mstars_metals_bulge, typeg, mvir_hosthalo, rstar_bulge) = hdf5_data
 
-    bin_it = functools.partial(us.wmedians, xbins=xmf)
     bin_it_2sigma = functools.partial(us.wmedians_2sigma, xbins=xmf)
 
     mgas = mgas_disk+mgas_bulge
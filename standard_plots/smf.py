@@ -1083,6 +1083,13 @@ def prepare_data(hdf5_data, index, hist_smf, hist_smf_err, hist_smf_cen, hist_sm
 
     mgas = mgas_disk+mgas_bulge
     mgas_metals = mgas_metals_disk+mgas_metals_bulge
+    mstars = mdisk+mbulge
+    sfr = sfr_disk+sfr_burst
+    matom = mHI+mHI_bulge
+    mmol = mH2+mH2_bulge
+    mstars_metals = mstars_metals_disk+mstars_metals_bulge
+    log_h0 = np.log10(float(h0))
+    log_XH = np.log10(XH)
 
     mass          = np.zeros(shape = len(mdisk))
     mass_30kpc    = np.zeros(shape = len(mdisk))
@@ -1096,9 +1103,9 @@ def prepare_data(hdf5_data, index, hist_smf, hist_smf_err, hist_smf_cen, hist_sm
     mass_mol_cen = np.zeros(shape = len(mdisk))
     mass_mol_sat = np.zeros(shape = len(mdisk))
 
-    ind = np.where((mdisk+mbulge) > 0.0)
-    mass[ind] = np.log10(mdisk[ind] + mbulge[ind]) - np.log10(float(h0))
-    print('number of galaxies with mstars>0 and max mass: %d, %d' % (len(mass[ind]), max(mass[ind])))
+    ind = np.where(mstars > 0.0)
+    mass[ind] = np.log10(mstars[ind]) - log_h0
+    print('number of galaxies with mstars>0 and max mass: %d, %d' % (len(mass[ind]), mass[ind].max()))
 
     H, _ = np.histogram(mass,bins=np.append(mbins,mupp))
     hist_smf[index,:] = hist_smf[index,:] + H
@@ -1114,7 +1121,7 @@ def prepare_data(hdf5_data, index, hist_smf, hist_smf_err, hist_smf_cen, hist_sm
     massb_30kpc[ind] = mbulge[ind] * pow(30.0, 3.0) / pow((pow(30.0, 2.0) + pow(rstar_bulge[ind]/1.3/h0 * MpcToKpc, 2.0)), 3.0/2.0)
 
     ind = np.where((massd_30kpc + massb_30kpc) > 0)
-    mass_30kpc[ind] = np.log10(massd_30kpc[ind] + massb_30kpc[ind]) - np.log10(float(h0))
+    mass_30kpc[ind] = np.log10(massd_30kpc[ind] + massb_30kpc[ind]) - log_h0
     H, _ = np.histogram(mass_30kpc,bins=np.append(mbins,mupp))
     hist_smf_30kpc[index,:] = hist_smf_30kpc[index,:] + H
 
@@ -1126,93 +1133,93 @@ def prepare_data(hdf5_data, index, hist_smf, hist_smf_err, hist_smf_cen, hist_sm
     H, _ = np.histogram(mass[ind],bins=np.append(mbins,mupp))
     hist_smf_sat[index,:] = hist_smf_sat[index,:] + H
 
-    ind = np.where((mHI+mHI_bulge) > 0)
-    mass_atom[ind] = np.log10(mHI[ind]+mHI_bulge[ind]) - np.log10(float(h0)) + np.log10(XH)
+    ind = np.where(matom > 0)
+    mass_atom[ind] = np.log10(matom[ind]) - log_h0 + log_XH
 
     H_HI, _ = np.histogram(mass_atom,bins=np.append(mbins,mupp))
     hist_HImf[index,:] = hist_HImf[index,:] + H_HI
 
-    ind = np.where(((mHI+mHI_bulge) > 0) & (typeg == 0))
-    mass_atom_cen[ind] = np.log10(mHI[ind]+mHI_bulge[ind]) - np.log10(float(h0)) + np.log10(XH)
+    ind = np.where((matom > 0) & (typeg == 0))
+    mass_atom_cen[ind] = np.log10(matom[ind]) - log_h0 + log_XH
     H_HI, _ = np.histogram(mass_atom_cen,bins=np.append(mbins,mupp))
     hist_HImf_cen[index,:] = hist_HImf_cen[index,:] + H_HI
 
-    ind = np.where(((mHI+mHI_bulge) > 0) & (typeg > 0))
-    mass_atom_sat[ind] = np.log10(mHI[ind]+mHI_bulge[ind]) - np.log10(float(h0)) + np.log10(XH)
+    ind = np.where((matom > 0) & (typeg > 0))
+    mass_atom_sat[ind] = np.log10(matom[ind]) - log_h0 + log_XH
     H_HI, _ = np.histogram(mass_atom_sat,bins=np.append(mbins,mupp))
     hist_HImf_sat[index,:] = hist_HImf_sat[index,:] + H_HI
 
-    ind = np.where((mH2+mH2_bulge) > 0)
-    mass_mol[ind] = np.log10(mH2[ind]+mH2_bulge[ind]) - np.log10(float(h0)) + np.log10(XH)
+    ind = np.where(mmol > 0)
+    mass_mol[ind] = np.log10(mmol[ind]) - log_h0 + log_XH
     H_H2, _ = np.histogram(mass_mol,bins=np.append(mbins,mupp))
     hist_H2mf[index,:] = hist_H2mf[index,:] + H_H2
 
-    ind = np.where(((mH2+mH2_bulge) > 0) & (typeg == 0))
-    mass_mol_cen[ind] = np.log10(mH2[ind]+mH2_bulge[ind]) - np.log10(float(h0)) + np.log10(XH)
+    ind = np.where((mmol > 0) & (typeg == 0))
+    mass_mol_cen[ind] = np.log10(mmol[ind]) - log_h0 + log_XH
     H_H2, _ = np.histogram(mass_mol_cen,bins=np.append(mbins,mupp))
     hist_H2mf_cen[index,:] = hist_H2mf_cen[index,:] + H_H2
 
-    ind = np.where(((mH2+mH2_bulge) > 0) & (typeg > 0))
-    mass_mol_sat[ind] = np.log10(mH2[ind]+mH2_bulge[ind]) - np.log10(float(h0)) + np.log10(XH)
+    ind = np.where((mmol > 0) & (typeg > 0))
+    mass_mol_sat[ind] = np.log10(mmol[ind]) - log_h0 + log_XH
     H_H2, _ = np.histogram(mass_mol_sat,bins=np.append(mbins,mupp))
     hist_H2mf_sat[index,:] = hist_H2mf_sat[index,:] + H_H2
 
     bin_it = functools.partial(us.wmedians, xbins=xmf)
     bin_it_2sigma = functools.partial(us.wmedians_2sigma, xbins=xmf)
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (mdisk+mbulge > 0))
-    mainseq[index,:] = bin_it(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])))
-    passive_fractions[index,0,:] = us.fractions(x=np.log10(mdisk[ind]+mbulge[ind]) - np.log10(float(h0)), y = np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])), xbins=xmf2, ythresh=-2.2)
+    ind = np.where((sfr > 0) & (mstars > 0))
+    mainseq[index,:] = bin_it(x=mass[ind], y=np.log10(sfr[ind]/mstars[ind]))
+    passive_fractions[index,0,:] = us.fractions(x=mass[ind], y = np.log10(sfr[ind]/mstars[ind]), xbins=xmf2, ythresh=-2.2)
     passive_fractions[index,0,:] = 1.0 - passive_fractions[index,0,:] 
-    H, _ = np.histogram(np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])),bins=np.append(ssfrbins,ssfrupp))
+    H, _ = np.histogram(np.log10(sfr[ind]/mstars[ind]),bins=np.append(ssfrbins,ssfrupp))
     hist_ssfr[index,:] = hist_ssfr[index,:] + H
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (mdisk+mbulge > 0) & (mvir_hosthalo < 1e11))
-    passive_fractions[index,1,:] = us.fractions(x=np.log10(mdisk[ind]+mbulge[ind]) - np.log10(float(h0)), y = np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])), xbins=xmf2, ythresh=-2.2)
+    ind = np.where((sfr > 0) & (mstars > 0) & (mvir_hosthalo < 1e11))
+    passive_fractions[index,1,:] = us.fractions(x=mass[ind], y = np.log10(sfr[ind]/mstars[ind]), xbins=xmf2, ythresh=-2.2)
     passive_fractions[index,1,:] = 1.0 - passive_fractions[index,1,:] 
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (mdisk+mbulge > 0) & (mvir_hosthalo >= 1e11))
-    passive_fractions[index,2,:] = us.fractions(x=np.log10(mdisk[ind]+mbulge[ind]) - np.log10(float(h0)), y = np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])), xbins=xmf2, ythresh=-2.2)
+    ind = np.where((sfr > 0) & (mstars > 0) & (mvir_hosthalo >= 1e11))
+    passive_fractions[index,2,:] = us.fractions(x=mass[ind], y = np.log10(sfr[ind]/mstars[ind]), xbins=xmf2, ythresh=-2.2)
     passive_fractions[index,2,:] = 1.0 - passive_fractions[index,2,:] 
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (mH2+mH2_bulge > 0) & (mass > 0))
-    sfe[index,:] = bin_it(x=mass[ind], y=np.log10((mH2[ind]+mH2_bulge[ind])/(sfr_disk[ind]+sfr_burst[ind])))
+    ind = np.where((sfr > 0) & (mmol > 0) & (mass > 0))
+    sfe[index,:] = bin_it(x=mass[ind], y=np.log10(mmol[ind]/sfr[ind]))
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (typeg == 0) & (mdisk+mbulge > 0))
-    mainseq_cen[index,:] = bin_it(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])))
-    mainseqsf_cen[index,:] = bin_it(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/h0/GyrToYr))
-    sfe_cen[index,:] = bin_it(x=mass[ind], y=np.log10((mH2[ind]+mH2_bulge[ind])/(sfr_disk[ind]+sfr_burst[ind])))
+    ind = np.where((sfr > 0) & (typeg == 0) & (mstars > 0))
+    mainseq_cen[index,:] = bin_it(x=mass[ind], y=np.log10(sfr[ind]/mstars[ind]))
+    mainseqsf_cen[index,:] = bin_it(x=mass[ind], y=np.log10(sfr[ind]/h0/GyrToYr))
+    sfe_cen[index,:] = bin_it(x=mass[ind], y=np.log10(mmol[ind]/sfr[ind]))
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (typeg > 0) & (mdisk+mbulge > 0))
-    mainseq_sat[index,:] = bin_it(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/(mdisk[ind]+mbulge[ind])))
-    mainseqsf_sat[index,:] = bin_it(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/h0/GyrToYr))
-    sfe_sat[index,:] = bin_it(x=mass[ind], y=np.log10((mH2[ind]+mH2_bulge[ind])/(sfr_disk[ind]+sfr_burst[ind])))
+    ind = np.where((sfr > 0) & (typeg > 0) & (mstars > 0))
+    mainseq_sat[index,:] = bin_it(x=mass[ind], y=np.log10(sfr[ind]/mstars[ind]))
+    mainseqsf_sat[index,:] = bin_it(x=mass[ind], y=np.log10(sfr[ind]/h0/GyrToYr))
+    sfe_sat[index,:] = bin_it(x=mass[ind], y=np.log10(mmol[ind]/sfr[ind]))
 
     ind = np.where((mgas_metals > 0.0) & (mgas > 0))
     mzr[index,:] = bin_it(x=mass[ind], y=np.log10((mgas_metals[ind]/mgas[ind]/Zsun)))
 
-    ind = np.where(mstars_metals_disk+mstars_metals_bulge > 0.0)
-    mszr[index,:] = bin_it(x=mass[ind], y=np.log10(((mstars_metals_disk[ind]+mstars_metals_bulge[ind])/(mdisk[ind]+mbulge[ind])/Zsun)))
+    ind = np.where(mstars_metals > 0.0)
+    mszr[index,:] = bin_it(x=mass[ind], y=np.log10((mstars_metals[ind]/mstars[ind]/Zsun)))
 
-    ind = np.where((mgas_metals > 0.0) & (mgas > 0) & (sfr_disk+sfr_burst > 0))
-    fmzr[index,:] = bin_it(x=mass[ind]-0.66*np.log10((sfr_disk[ind]+sfr_burst[ind])/h0/GyrToYr),
+    ind = np.where((mgas_metals > 0.0) & (mgas > 0) & (sfr > 0))
+    fmzr[index,:] = bin_it(x=mass[ind]-0.66*np.log10(sfr[ind]/h0/GyrToYr),
                            y=np.log10((mgas_metals[ind]/mgas[ind]/Zsun)))
 
     ind = np.where((mgas_metals > 0.0) & (typeg == 0) & (mgas > 1e5))
     mzr_cen[index,:] = bin_it(x=mass[ind], y=np.log10((mgas_metals[ind]/mgas[ind]/Zsun)))
-    ind = np.where((mstars_metals_disk+mstars_metals_bulge > 0.0) & (typeg == 0) )
-    mszr_cen[index,:] = bin_it(x=mass[ind], y=np.log10(((mstars_metals_disk[ind]+mstars_metals_bulge[ind])/(mdisk[ind]+mbulge[ind])/Zsun)))
+    ind = np.where((mstars_metals > 0.0) & (typeg == 0) )
+    mszr_cen[index,:] = bin_it(x=mass[ind], y=np.log10((mstars_metals[ind]/mstars[ind]/Zsun)))
 
     ind = np.where((mgas_metals > 0.0) & (typeg > 0) & (mgas > 1e5) & (mass > 8))
     mzr_sat[index,:] = bin_it(x=mass[ind], y=np.log10((mgas_metals[ind]/mgas[ind]/Zsun)))
-    ind = np.where((mstars_metals_disk+mstars_metals_bulge > 0.0) & (typeg > 0) & (mass > 8))
-    mszr_sat[index,:] = bin_it(x=mass[ind], y=np.log10(((mstars_metals_disk[ind]+mstars_metals_bulge[ind])/(mdisk[ind]+mbulge[ind])/Zsun)))
+    ind = np.where((mstars_metals > 0.0) & (typeg > 0) & (mass > 8))
+    mszr_sat[index,:] = bin_it(x=mass[ind], y=np.log10((mstars_metals[ind]/mstars[ind]/Zsun)))
 
-    ind = np.where((sfr_disk+sfr_burst > 0) & (mdisk+mbulge > 0) & ((sfr_disk+sfr_burst)/(mdisk+mbulge) > 1e-3))
-    mainseqsf[index,:] = bin_it_2sigma(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/h0/GyrToYr))
-    mainseqsf_1s[index,:] = bin_it(x=mass[ind], y=np.log10((sfr_disk[ind]+sfr_burst[ind])/h0/GyrToYr))
-    mainseqHI[index,:] = bin_it(x=mass[ind], y=np.log10((mHI[ind]+mHI_bulge[ind])/(mdisk[ind]+mbulge[ind])))
-    mainseqH2[index,:] = bin_it(x=mass[ind], y=np.log10((mH2[ind]+mH2_bulge[ind])/(mdisk[ind]+mbulge[ind])))
+    ind = np.where((sfr > 0) & (mstars > 0) & (sfr/mstars > 1e-3))
+    mainseqsf[index,:] = bin_it_2sigma(x=mass[ind], y=np.log10(sfr[ind]/h0/GyrToYr))
+    mainseqsf_1s[index,:] = bin_it(x=mass[ind], y=np.log10(sfr[ind]/h0/GyrToYr))
+    mainseqHI[index,:] = bin_it(x=mass[ind], y=np.log10(matom[ind]/mstars[ind]))
+    mainseqH2[index,:] = bin_it(x=mass[ind], y=np.log10(mmol[ind]/mstars[ind]))
 
     if volh > 0:
         vol = volh/pow(h0,3.)  # In Mpc^3
@@ -1238,6 +1245,31 @@ def prepare_data(hdf5_data, index, hist_smf, hist_smf_err, hist_smf_cen, hist_sm
 
     return mass
 
+# The fields needed by prepare_smf_HImf_data, in the order it expects them
+smf_HImf_fields = {'galaxies': ('mstars_disk', 'mstars_bulge', 'matom_disk', 'matom_bulge')}
+
+def prepare_smf_HImf_data(hdf5_data, index, hist_smf, hist_HImf):
+    """Like prepare_data, but only accumulates the SMF and HIMF histograms.
+    `hdf5_data` must have been read using `smf_HImf_fields`"""
+
+    (h0, volh, mdisk, mbulge, mHI, mHI_bulge) = hdf5_data
+    log_h0 = np.log10(float(h0))
+
+    mstars = mdisk+mbulge
+    mass = np.log10(mstars[mstars > 0.0]) - log_h0
+    H, _ = np.histogram(mass,bins=np.append(mbins,mupp))
+    hist_smf[index,:] = hist_smf[index,:] + H
+
+    matom = mHI+mHI_bulge
+    mass_atom = np.log10(matom[matom > 0]) - log_h0 + np.log10(XH)
+    H_HI, _ = np.histogram(mass_atom,bins=np.append(mbins,mupp))
+    hist_HImf[index,:] = hist_HImf[index,:] + H_HI
+
+    if volh > 0:
+        vol = volh/pow(h0,3.)  # In Mpc^3
+        hist_smf[index,:]  = hist_smf[index,:]/vol/dm
+        hist_HImf[index,:] = hist_HImf[index,:]/vol/dm
+
 def main(modeldir, outdir, redshift_table, subvols, obsdir):
 
     zlist = (0, 0.5, 1, 2, 3, 4)
@@ -1318,30 +1350,19 @@ def main(modeldir, outdir, redshift_table, subvols, obsdir):
     # This should be the same in all HDF5 files
 
     # Take logs
-    ind = np.where(hist_smf > 0.)
-    hist_smf[ind] = np.log10(hist_smf[ind])
-    ind = np.where(hist_smf_30kpc > 0.)
-    hist_smf_30kpc[ind] = np.log10(hist_smf_30kpc[ind])
-    ind = np.where(hist_smf_cen > 0.)
-    hist_smf_cen[ind] = np.log10(hist_smf_cen[ind])
-    ind = np.where(hist_smf_sat > 0.)
-    hist_smf_sat[ind] = np.log10(hist_smf_sat[ind])
-    ind = np.where(hist_smf_err > 0.)
-    hist_smf_err[ind] = np.log10(hist_smf_err[ind])
-
-    ind = np.where(hist_HImf > 0.)
-    hist_HImf[ind] = np.log10(hist_HImf[ind])
-    ind = np.where(hist_HImf_cen > 0.)
-    hist_HImf_cen[ind] = np.log10(hist_HImf_cen[ind])
-    ind = np.where(hist_HImf_sat > 0.)
-    hist_HImf_sat[ind] = np.log10(hist_HImf_sat[ind])
-
-    ind = np.where(hist_H2mf > 0.)
-    hist_H2mf[ind] = np.log10(hist_H2mf[ind])
-    ind = np.where(hist_H2mf_cen > 0.)
-    hist_H2mf_cen[ind] = np.log10(hist_H2mf_cen[ind])
-    ind = np.where(hist_H2mf_sat > 0.)
-    hist_H2mf_sat[ind] = np.log10(hist_H2mf_sat[ind])
+    np.log10(hist_smf, out=hist_smf, where=hist_smf > 0.)
+    np.log10(hist_smf_30kpc, out=hist_smf_30kpc, where=hist_smf_30kpc > 0.)
+    np.log10(hist_smf_cen, out=hist_smf_cen, where=hist_smf_cen > 0.)
+    np.log10(hist_smf_sat, out=hist_smf_sat, where=hist_smf_sat > 0.)
+    np.log10(hist_smf_err, out=hist_smf_err, where=hist_smf_err > 0.)
+
+    np.log10(hist_HImf, out=hist_HImf, where=hist_HImf > 0.)
+    np.log10(hist_HImf_cen, out=hist_HImf_cen, where=hist_HImf_cen > 0.)
+    np.log10(hist_HImf_sat, out=hist_HImf_sat, where=hist_HImf_sat > 0.)
+
+    np.log10(hist_H2mf, out=hist_H2mf, where=hist_H2mf > 0.)
+    np.log10(hist_H2mf_cen, out=hist_H2mf_cen, where=hist_H2mf_cen > 0.)
+    np.log10(hist_H2mf_sat, out=hist_H2mf_sat, where=hist_H2mf_sat > 0.)
 
     #for z in range (0,len(zlist)):
     #    print 'redshift=',zlist[z]
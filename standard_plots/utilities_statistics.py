@@ -20,28 +20,41 @@
 import numpy as np
 import scipy.optimize as so
 
-def wmedians_2sigma(x=None, y=None, xbins=None):
+def _sorted_bins(x, y, xbins):
+    """Yields the bin index and the sorted y values of the objects whose x
+    values fall within each of `xbins`, which are assumed to be equally spaced.
+
+    x is sorted only once, and the objects of each bin are then found with a
+    binary search rather than with a full pass over x per bin."""
+
+    x = np.ravel(x)
+    y = np.ravel(y)
+    xbins = np.asarray(xbins)
 
-    nbins = len(xbins)
     #define size of bins, assuming bins are all equally spaced.
     dx = xbins[1] - xbins[0]
-    result = np.zeros(shape = (3, nbins))
+    order = np.argsort(x)
+    xsorted = x[order]
+    ysorted = y[order]
+    lows = np.searchsorted(xsorted, xbins - dx/2.0, side='right')
+    ups = np.searchsorted(xsorted, xbins + dx/2.0, side='left')
 
-    for i in range (0,nbins):
-        xlow = xbins[i]-dx/2.0
-        xup  = xbins[i]+dx/2.0
-        ind  = np.where((x > xlow) & (x< xup))
-        if(len(x[ind]) > 9):
+    for i, (low, up) in enumerate(zip(lows, ups)):
+        yield i, np.sort(ysorted[low:up])
 
-            obj_bin = len(x[ind])
-            ybin    = y[ind]
+def wmedians_2sigma(x=None, y=None, xbins=None):
+
+    nbins = len(xbins)
+    result = np.zeros(shape = (3, nbins))
+
+    for i, ybin in _sorted_bins(x, y, xbins):
+        obj_bin = len(ybin)
+        if(obj_bin > 9):
             result[0, i] = np.median(ybin)
-            #sort array on 1/y because we want it to sort from the smallest to the largest item, and the default of argsort is to order from the largest to the smallest.
-            IDs = np.argsort(ybin,kind='quicksort')
             ID16th = int(np.floor(obj_bin*0.025))+1   #take the lower edge.
             ID84th = int(np.floor(obj_bin*0.975))-1   #take the upper edge.
-            result[1, i] = np.abs(result[0, i] - ybin[IDs[ID16th]])
-            result[2, i] = np.abs(ybin[IDs[ID84th]] - result[0, i])
+            result[1, i] = np.abs(result[0, i] - ybin[ID16th])
+            result[2, i] = np.abs(ybin[ID84th] - result[0, i])
 
     return result
 
@@ -49,30 +62,20 @@ def wmedians_2sigma(x=None, y=None, xbins=None):
 def wmedians(x=None, y=None, xbins=None, low_numbers=False):
 
     nbins = len(xbins)
-    #define size of bins, assuming bins are all equally spaced.
-    dx = xbins[1] - xbins[0]
     result = np.zeros(shape = (3, nbins))
 
-    for i in range (0,nbins):
-        xlow = xbins[i]-dx/2.0
-        xup  = xbins[i]+dx/2.0
-        ind  = np.where((x > xlow) & (x< xup))
-        if(len(x[ind]) > 9):
-
-            obj_bin = len(x[ind])
-            ybin    = y[ind]
+    for i, ybin in _sorted_bins(x, y, xbins):
+        obj_bin = len(ybin)
+        if(obj_bin > 9):
             result[0, i] = np.median(ybin)
-            #sort array on 1/y because we want it to sort from the smallest to the largest item, and the default of argsort is to order from the largest to the smallest.
-            IDs = np.argsort(ybin,kind='quicksort')
             ID16th = int(np.floor(obj_bin*0.16))+1   #take the lower edge.
             ID84th = int(np.floor(obj_bin*0.84))-1   #take the upper edge.
-            result[1, i] = np.abs(result[0, i] - ybin[IDs[ID16th]])
-            result[2, i] = np.abs(ybin[IDs[ID84th]] - result[0, i])
-        elif(low_numbers and len(x[ind]) > 0):
-            ybin    = y[ind]
+            result[1, i] = np.abs(result[0, i] - ybin[ID16th])
+            result[2, i] = np.abs(ybin[ID84th] - result[0, i])
+        elif(low_numbers and obj_bin > 0):
             result[0, i] = np.median(ybin)
-            result[1, i] = np.abs(result[0, i] - np.min(y[ind]))
-            result[2, i] = np.abs(np.max(y[ind]) - result[0, i])
+            result[1, i] = np.abs(result[0, i] - ybin[0])
+            result[2, i] = np.abs(ybin[-1] - result[0, i])
 
     return result
 
@@ -128,8 +131,8 @@ def fractional_contribution(x=None, y=None, xbins=None):
         xup  = xbins[i]+dx/2.0
         ind  = np.where((x > xlow) & (x< xup))
         if(len(x[ind]) > 4):
-            mtotal    = sum(x[ind])
-            mbulge_tot= sum(x[ind]*y[ind])
+            mtotal    = np.sum(x[ind])
+            mbulge_tot= np.sum(x[ind]*y[ind])
             result[i] = mbulge_tot/mtotal
         else:
             result[i] = -1